@@ -0,0 +1,49 @@
+#!/usr/bin/env bash
+# Builds OpenCV + opencv_contrib (needed for cv2.face) with AVX2 as the CPU
+# baseline and TBB enabled, then installs the Python bindings into the
+# site-packages of $PYTHON (the active python3 by default). The C++ libraries
+# go under that Python's prefix too, so no root is needed inside a venv.
+#
+# Uninstall the pip wheels first, otherwise they shadow this build:
+#   pip uninstall opencv-python opencv-contrib-python
+#
+# Usage: ./build_opencv.sh [opencv version]
+set -euo pipefail
+
+OPENCV_VERSION="${1:-4.10.0}"
+BUILD_DIR="${BUILD_DIR:-$PWD/opencv-build}"
+PYTHON="${PYTHON:-$(command -v python3)}"
+PYTHON_PREFIX="$("$PYTHON" -c 'import sys; print(sys.prefix)')"
+PYTHON_PACKAGES="$("$PYTHON" -c 'import sysconfig; print(sysconfig.get_paths()["platlib"])')"
+
+if "$PYTHON" -m pip show -q opencv-python opencv-contrib-python >/dev/null 2>&1; then
+    echo "Warning: a pip-installed OpenCV wheel is present and will shadow this build."
+    echo "Run: $PYTHON -m pip uninstall opencv-python opencv-contrib-python"
+fi
+
+mkdir -p "$BUILD_DIR"
+cd "$BUILD_DIR"
+
+[ -d opencv ] || git clone --depth 1 --branch "$OPENCV_VERSION" https://github.com/opencv/opencv.git
+[ -d opencv_contrib ] || git clone --depth 1 --branch "$OPENCV_VERSION" https://github.com/opencv/opencv_contrib.git
+
+cmake -S opencv -B build \
+    -DCMAKE_BUILD_TYPE=Release \
+    -DCMAKE_INSTALL_PREFIX="$PYTHON_PREFIX" \
+    -DOPENCV_EXTRA_MODULES_PATH="$BUILD_DIR/opencv_contrib/modules" \
+    -DCPU_BASELINE=AVX2 \
+    -DCPU_DISPATCH=AVX2,AVX512_SKX \
+    -DWITH_TBB=ON \
+    -DBUILD_opencv_world=ON \
+    -DBUILD_opencv_python3=ON \
+    -DPYTHON3_EXECUTABLE="$PYTHON" \
+    -DPYTHON3_PACKAGES_PATH="$PYTHON_PACKAGES" \
+    -DBUILD_TESTS=OFF \
+    -DBUILD_PERF_TESTS=OFF \
+    -DBUILD_EXAMPLES=OFF
+
+cmake --build build -j"$(nproc)"
+cmake --install build
+
+echo "Done. Check the result with:"
+echo "  $PYTHON -c \"import cv2; print(cv2.getBuildInformation())\""
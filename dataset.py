@@ -1,11 +1,19 @@
 import cv2
+import numpy as np
 import os
-import time
+import queue
+import threading
+from face_detection import (CASCADE_PATH, FULL_SCAN_EVERY_N, detect_faces, expand_roi,
+                            frame_changed, load_face_detector, motion_thumbnail)
 
 # --- Constants ---
-CASCADE_PATH = "haarcascade_frontalface_default.xml"
+FRAME_WIDTH = 640  # Capture resolution requested from the camera driver
+FRAME_HEIGHT = 480
 DATASET_PATH = "dataset"
 IMAGES_TO_CAPTURE = 50
+SAVE_EVERY_N_FRAMES = 3  # Only decode and save from 1 of every N camera frames
+JPEG_QUALITY = 90
+FACE_SIZE = (100, 100)  # Saved faces are resized so training can use them as-is
 
 def get_camera_index():
     """Asks the user for the camera index."""
@@ -19,6 +27,31 @@ def get_camera_index():
         print("Invalid input. Using default camera 0.")
         return 0
 
+def _image_writer(save_queue, failed):
+    """
+    Encodes and writes queued (path, image) pairs until it receives None.
+    Paths that could not be saved are appended to failed.
+    """
+    while True:
+        item = save_queue.get()
+        try:
+            if item is None:
+                return
+            img_path, face_roi = item
+            ok, buf = cv2.imencode('.jpg', face_roi, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            if not ok:
+                print(f"Warning: Could not encode image {img_path}")
+                failed.append(img_path)
+                continue
+            try:
+                with open(img_path, 'wb') as f:
+                    f.write(buf.tobytes())
+            except OSError as e:
+                print(f"Warning: Could not write image {img_path}: {e}")
+                failed.append(img_path)
+        finally:
+            save_queue.task_done()
+
 def create_dataset():
     """
     Captures and saves face images from the webcam for a new user.
@@ -33,9 +66,9 @@ def create_dataset():
     os.makedirs(user_dataset_path, exist_ok=True)
     print(f"Dataset directory created at: {user_dataset_path}")
 
-    # Load the Haar cascade for face detection
+    # Load the cascade for face detection
     try:
-        face_detector = cv2.CascadeClassifier(CASCADE_PATH)
+        face_detector = load_face_detector()
     except cv2.error as e:
         print(f"Error loading cascade file: {e}")
         print(f"Make sure '{CASCADE_PATH}' is in the same directory.")
@@ -52,12 +85,37 @@ def create_dataset():
         print("Please check if the camera is connected or try a different index.")
         return
 
+    # Ask the driver for small MJPEG frames and keep only the latest one queued
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
     print("\nStarting face capture. Look at the camera and move your head slightly.")
     print("Press 'q' to quit early.")
 
+    # Save images on a background thread so disk I/O never stalls the capture loop
+    save_queue = queue.Queue()
+    failed = []
+    writer = threading.Thread(target=_image_writer, args=(save_queue, failed), daemon=True)
+    writer.start()
+
+    gray_buf = None  # Grayscale buffer reused between frames
+    roi = None  # Area around the last detected face
+    scans_since_full = 0
+    prev_thumb = None  # Thumbnail of the last frame detection ran on
+    faces = []
     count = 0
+    frame_idx = 0
     while count < IMAGES_TO_CAPTURE:
-        ret, frame = cap.read()
+        # Grab every camera frame but only decode 1 of every N. This paces the
+        # saved images so they capture head movement without stalling the camera.
+        ret = cap.grab()
+        frame_idx += 1
+        if ret and frame_idx % SAVE_EVERY_N_FRAMES != 0:
+            continue
+        if ret:
+            ret, frame = cap.retrieve()
         if not ret:
             print("Error: Failed to capture frame.")
             break
@@ -65,30 +123,54 @@ def create_dataset():
         # Flip the frame horizontally (like a mirror)
         frame = cv2.flip(frame, 1)
         # Convert to grayscale for detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Detect faces
-        faces = face_detector.detectMultiScale(gray, 1.3, 5)
-
-        for (x, y, w, h) in faces:
-            # Draw a rectangle around the detected face
+        if gray_buf is None or gray_buf.shape != frame.shape[:2]:
+            gray_buf = np.empty(frame.shape[:2], dtype=np.uint8)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray_buf)
+
+        # Only run detection if the frame changed since the last detection,
+        # otherwise keep the previous face boxes for display
+        thumb = motion_thumbnail(gray)
+        detected = frame_changed(thumb, prev_thumb)
+        if detected:
+            prev_thumb = thumb
+
+            # Detect faces, only around the last face while it is being tracked
+            faces = []
+            if roi is not None and scans_since_full < FULL_SCAN_EVERY_N:
+                faces = detect_faces(face_detector, gray, roi)
+                scans_since_full += 1
+            if not faces:
+                faces = detect_faces(face_detector, gray)
+                scans_since_full = 0
+            roi = expand_roi(faces, gray.shape) if faces else None
+
+        # Only save faces at least FACE_SIZE, so saved images are never
+        # upscaled from a too-small crop, filtered in one vectorized step
+        all_boxes = np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+        big_enough = (all_boxes[:, 2] >= FACE_SIZE[0]) & (all_boxes[:, 3] >= FACE_SIZE[1])
+        boxes = all_boxes[big_enough].tolist()
+
+        # Draw faces that will be saved in blue, faces too small to save in red
+        for (x, y, w, h) in boxes:
             cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-            
-            # Save the captured face (the grayscale version)
-            face_roi = gray[y:y+h, x:x+w]
-            
-            # Only save if a face is clearly detected
-            if face_roi.size > 0:
+        for (x, y, w, h) in all_boxes[~big_enough].tolist():
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
+            cv2.putText(frame, "Move closer", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+        # Only save on frames where detection ran, the cached boxes may no
+        # longer match a face that turned slightly
+        if detected:
+            for (x, y, w, h) in boxes:
+                # Queue the captured face (the grayscale version) for saving
                 count += 1
                 img_path = os.path.join(user_dataset_path, f"image_{count}.jpg")
-                cv2.imwrite(img_path, face_roi)
+                save_queue.put((img_path, cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE, interpolation=cv2.INTER_AREA)))
 
-                # Display capture status on the frame
-                status_text = f"Capturing... {count}/{IMAGES_TO_CAPTURE}"
-                cv2.putText(frame, status_text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-            
-            # Brief pause to allow for slight head movement
-            time.sleep(0.05) 
+        # Display capture status above the last saved face
+        if boxes:
+            x, y = boxes[-1][:2]
+            status_text = f"Capturing... {count}/{IMAGES_TO_CAPTURE}"
+            cv2.putText(frame, status_text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
 
         # Display the video feed
         cv2.imshow('Create Dataset', frame)
@@ -97,8 +179,14 @@ def create_dataset():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             print("Capture interrupted by user.")
             break
-            
-    print(f"\nCaptured {count} images successfully.")
+
+    # Wait for all pending images to be written to disk
+    save_queue.put(None)
+    save_queue.join()
+
+    print(f"\nCaptured {count - len(failed)} images successfully.")
+    if failed:
+        print(f"Warning: {len(failed)} images could not be saved.")
 
     # Clean up
     cap.release()
@@ -0,0 +1,69 @@
+import cv2
+import os
+
+# --- Constants ---
+# LBP cascade uses integer features and is much faster than Haar, at a
+# small cost in accuracy. It is used when its XML file is present (see
+# README.md for the download), otherwise the bundled Haar cascade is, with
+# the Haar detection parameters. Set USE_LBP_CASCADE = False to always use Haar.
+USE_LBP_CASCADE = True
+LBP_CASCADE_PATH = "lbpcascade_frontalface_improved.xml"
+HAAR_CASCADE_PATH = "haarcascade_frontalface_default.xml"
+if USE_LBP_CASCADE and os.path.exists(LBP_CASCADE_PATH):
+    CASCADE_NAME = "LBP"
+    CASCADE_PATH = LBP_CASCADE_PATH
+    SCALE_FACTOR, MIN_NEIGHBORS = 1.2, 4
+else:
+    CASCADE_NAME = "Haar"
+    CASCADE_PATH = HAAR_CASCADE_PATH
+    SCALE_FACTOR, MIN_NEIGHBORS = 1.3, 5
+DETECTION_SCALE = 0.5  # Run the detector on a downscaled copy of the frame
+ROI_MARGIN = 0.3  # Grow the tracked face box by 30% on each side
+FULL_SCAN_EVERY_N = 30  # Re-scan the whole frame every N detections to pick up new faces
+MOTION_THUMB_SIZE = (80, 60)  # Thumbnail size used to check for motion
+MOTION_THRESHOLD = 2.0  # Mean absolute pixel difference below which a frame counts as unchanged
+USE_OPENCL = cv2.ocl.haveOpenCL()  # Offload resize/detection to the GPU via UMat when available
+
+def load_face_detector():
+    """Loads the selected cascade and reports which one is in use."""
+    face_detector = cv2.CascadeClassifier(CASCADE_PATH)
+    print(f"Using {CASCADE_NAME} cascade: {CASCADE_PATH}")
+    return face_detector
+
+def detect_faces(face_detector, gray, roi=None):
+    """
+    Detects faces on a downscaled copy of the grayscale image, searching only
+    inside roi (x0, y0, x1, y1) when given. Returns full-resolution boxes.
+    """
+    x0, y0 = 0, 0
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        gray = gray[y0:y1, x0:x1]
+    if USE_OPENCL:
+        # Only the detection input goes to the GPU, the crops stay on the CPU
+        gray = cv2.UMat(gray)
+    small = cv2.resize(gray, None, fx=DETECTION_SCALE, fy=DETECTION_SCALE, interpolation=cv2.INTER_AREA)
+    faces = face_detector.detectMultiScale(small, scaleFactor=SCALE_FACTOR, minNeighbors=MIN_NEIGHBORS,
+                                           minSize=(40, 40), flags=cv2.CASCADE_SCALE_IMAGE)
+    # Map detections back to full-resolution image coordinates so the face
+    # crop keeps its detail
+    return [(x0 + int(x / DETECTION_SCALE), y0 + int(y / DETECTION_SCALE),
+             int(w / DETECTION_SCALE), int(h / DETECTION_SCALE)) for (x, y, w, h) in faces]
+
+def expand_roi(faces, shape):
+    """Returns the box around all faces, inflated by ROI_MARGIN and clipped to shape."""
+    x0 = min(x for (x, y, w, h) in faces)
+    y0 = min(y for (x, y, w, h) in faces)
+    x1 = max(x + w for (x, y, w, h) in faces)
+    y1 = max(y + h for (x, y, w, h) in faces)
+    dx = int((x1 - x0) * ROI_MARGIN)
+    dy = int((y1 - y0) * ROI_MARGIN)
+    return (max(x0 - dx, 0), max(y0 - dy, 0), min(x1 + dx, shape[1]), min(y1 + dy, shape[0]))
+
+def motion_thumbnail(gray):
+    """Returns the small thumbnail used to compare frames for motion."""
+    return cv2.resize(gray, MOTION_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+def frame_changed(thumb, prev_thumb):
+    """True if there is no previous thumbnail or the frame moved noticeably since it."""
+    return prev_thumb is None or cv2.absdiff(thumb, prev_thumb).mean() >= MOTION_THRESHOLD
@@ -1,15 +1,36 @@
 import cv2
 import json
+import numpy as np
 import os
+import threading
+import time
 import tkinter as tk
 from tkinter import font as tkFont
 from PIL import Image, ImageTk
+from face_detection import (CASCADE_PATH, FULL_SCAN_EVERY_N, detect_faces, expand_roi,
+                            frame_changed, load_face_detector, motion_thumbnail)
+
+# orjson is optional, it only speeds up loading the name mapping
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numba is optional, it only speeds up scoring frames with many faces
+try:
+    import numba
+except ImportError:
+    numba = None
 
 # --- Constants ---
-CASCADE_PATH = "haarcascade_frontalface_default.xml"
+FRAME_WIDTH = 640  # Capture resolution requested from the camera driver
+FRAME_HEIGHT = 480
 MODEL_PATH = "model.yml"
 MAPPING_PATH = "name_mapping.json"
 CONF_THRESHOLD = 65  # Confidence threshold (lower is better for LBPH)
+FACE_SIZE = (100, 100)  # Must match the face size used for training
+DETECT_EVERY_N_TICKS = 4  # Run detection/recognition on 1 of every N frames
+CAMERA_TIMEOUT = 2.0  # Seconds without a frame before the camera is reported as lost
 
 def get_camera_index():
     """Asks the user for the camera index."""
@@ -23,6 +44,63 @@ def get_camera_index():
         print("Invalid input. Using default camera 0.")
         return 0
 
+def _classify(confidences, ids, threshold):
+    """
+    Returns (accepted, best_idx, best_id): a per-face mask of confidences below
+    threshold, and the index and id of the best match (lowest confidence
+    value), or (-1, -1) if no face is recognized.
+    """
+    accepted = np.zeros(confidences.shape[0], dtype=np.bool_)
+    best_idx = -1
+    best_id = -1
+    best_conf = threshold
+    for i in range(confidences.shape[0]):
+        accepted[i] = confidences[i] < threshold
+        if confidences[i] < best_conf:
+            best_conf = confidences[i]
+            best_idx = i
+            best_id = ids[i]
+    return accepted, best_idx, best_id
+
+classify = _classify
+
+def compile_classify():
+    """
+    Compiles classify with numba (if installed) now rather than on the first
+    detected face. Falls back to the plain Python version if compiling fails,
+    e.g. on a numba/numpy version mismatch or an unwritable cache directory.
+    """
+    global classify
+    if numba is None:
+        return
+    try:
+        compiled = numba.njit(cache=True)(_classify)
+        compiled(np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int32), float(CONF_THRESHOLD))
+    except Exception as e:
+        print(f"Warning: Could not compile classify with numba, using plain Python: {e}")
+        return
+    classify = compiled
+
+def warn_if_no_avx2():
+    """
+    Warns if the CPU supports AVX2 but the installed OpenCV build does not use
+    it as its baseline. Stock wheels only list AVX2 under "Dispatched code
+    generation", which covers a few kernels but not the whole library.
+    """
+    if not cv2.checkHardwareSupport(cv2.CPU_AVX2):
+        return
+    for line in cv2.getBuildInformation().splitlines():
+        line = line.strip()
+        if line.startswith("Baseline:"):
+            baseline = line[len("Baseline:"):].split()
+            break
+    else:
+        return # Unknown build information format, nothing to check
+
+    if "AVX2" not in baseline:
+        print(f"Warning: OpenCV baseline is {' '.join(baseline) or 'empty'}, without AVX2.")
+        print("Face detection will be slower. Run build_opencv.sh to build an AVX2/TBB enabled OpenCV.")
+
 class FaceLoginApp:
     def __init__(self, root, cam_index):
         self.root = root
@@ -34,6 +112,30 @@ class FaceLoginApp:
         self.cap = None
         self.cam_index = cam_index
 
+        # Camera grabbing and decoding run on their own thread. The GUI thread
+        # asks for a frame via _frame_wanted and picks up the decoded array
+        # under a short lock, so it never touches the capture itself.
+        self._frame_lock = threading.Lock()
+        self._latest_frame = None
+        self._frame_wanted = threading.Event()
+        self._last_frame_time = 0.0  # time.monotonic() of the last good frame
+        self._camera_lost = False
+        self._grab_thread = None
+        self._running = False
+
+        # Color conversion buffers reused between frames
+        self._gray = None
+        self._rgb = None
+
+        # Detection results reused on frames where detection is skipped
+        self._tick = 0
+        self._last_faces = []
+        self._last_result = []
+        self._roi = None  # Area around the last detected faces
+        self._scans_since_full = 0
+        self._prev_thumb = None  # Thumbnail of the last frame detection ran on
+        self._last_status = (None, None)  # (text, color) currently shown in the status label
+
         # --- Load Models ---
         self.models_loaded = self.load_models()
         if not self.models_loaded:
@@ -53,6 +155,7 @@ class FaceLoginApp:
         # Video Feed Label
         self.video_label = tk.Label(root)
         self.video_label.pack(pady=10, padx=10)
+        self.create_video_image(FRAME_WIDTH, FRAME_HEIGHT)
 
         # Status Label
         self.status_var = tk.StringVar()
@@ -81,18 +184,22 @@ class FaceLoginApp:
             self.recognizer = cv2.face.LBPHFaceRecognizer_create()
             self.recognizer.read(MODEL_PATH)
             
-            self.face_detector = cv2.CascadeClassifier(CASCADE_PATH)
+            self.face_detector = load_face_detector()
 
-            with open(MAPPING_PATH, 'r') as f:
-                name_mapping = json.load(f)
+            with open(MAPPING_PATH, 'rb') as f:
+                data = f.read()
+            name_mapping = orjson.loads(data) if orjson else json.loads(data)
             # Create a reverse mapping (ID -> Name)
             self.id_to_name = {v: k for k, v in name_mapping.items()}
             print("Model and name mapping loaded successfully.")
-            return True
+            warn_if_no_avx2()
         except Exception as e:
             print(f"Error loading models: {e}")
             return False
 
+        compile_classify()
+        return True
+
     def show_error_and_exit(self):
         """Displays an error in the GUI and prepares to exit."""
         error_label = tk.Label(self.root, text="Error: Failed to load models.\nSee console for details.", fg="red", font=self.header_font)
@@ -104,79 +211,175 @@ class FaceLoginApp:
         self.cap = cv2.VideoCapture(self.cam_index)
         if not self.cap.isOpened():
             print(f"Error: Could not open webcam at index {self.cam_index}.")
-            self.status_var.set(f"Error: Could not open camera {self.cam_index}")
-            self.status_label.config(fg="red")
+            self.set_status(f"Error: Could not open camera {self.cam_index}", "red")
             return
+        # Ask the driver for small MJPEG frames and keep only the latest one queued
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         print(f"Camera {self.cam_index} opened.")
 
+        self._running = True
+        self._last_frame_time = time.monotonic()
+        self._frame_wanted.set()
+        self._grab_thread = threading.Thread(target=self._grabber, daemon=True)
+        self._grab_thread.start()
+
+    def _grabber(self):
+        """
+        Continuously grabs frames so the driver queue never goes stale, and
+        decodes one only when the GUI has asked for it.
+        """
+        failing = False
+        while self._running:
+            ret = self.cap.grab()
+            if ret and self._frame_wanted.is_set():
+                ret, frame = self.cap.retrieve()
+                if ret:
+                    self._frame_wanted.clear()
+                    with self._frame_lock:
+                        self._latest_frame = frame
+            if not ret:
+                # Report each run of failures once and back off instead of
+                # spinning, update_frame shows it if it lasts too long
+                if not failing:
+                    print("Error: Failed to capture frame.")
+                failing = True
+                time.sleep(0.01)
+                continue
+            failing = False
+            self._last_frame_time = time.monotonic()
+
+    def create_video_image(self, width, height):
+        """Creates the PIL/Tk images that every frame is pasted into."""
+        self._pil = Image.new('RGB', (width, height))
+        self._tkimg = ImageTk.PhotoImage(self._pil)
+        self.video_label.configure(image=self._tkimg)
+
+    def set_status(self, text, color):
+        """Updates the status label, only touching Tk when the status changes."""
+        if (text, color) != self._last_status:
+            self.status_var.set(text)
+            self.status_label.config(fg=color)
+            self._last_status = (text, color)
+
     def update_frame(self):
         """Reads a frame from the webcam, processes it, and updates the GUI."""
-        if self.cap is None or not self.cap.isOpened():
+        if not self._running:
             return # Stop loop if camera isn't working
 
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Error: Failed to capture frame.")
-            self.root.after(10, self.update_frame) # Try again
+        # Take the decoded frame from the grab thread, if there is one yet
+        with self._frame_lock:
+            frame = self._latest_frame
+            self._latest_frame = None
+        if frame is None:
+            if not self._camera_lost and time.monotonic() - self._last_frame_time > CAMERA_TIMEOUT:
+                self._camera_lost = True
+                self.set_status(f"Error: Lost camera {self.cam_index}", "red")
+            self.root.after(5, self.update_frame) # Check again shortly
             return
+        if self._camera_lost:
+            # Camera is back, force a fresh detection to replace the error status
+            self._camera_lost = False
+            self._tick = 0
+            self._prev_thumb = None
+
+        # Let the grab thread decode the next frame while this one is processed
+        self._frame_wanted.set()
 
         frame = cv2.flip(frame, 1)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_detector.detectMultiScale(gray, 1.3, 5)
-
-        logged_in_name = None
-        status_color = "black"
-        status_text = "Scanning for face..."
-
-        for (x, y, w, h) in faces:
-            face_roi = gray[y:y+h, x:x+w]
-            id_num, confidence = self.recognizer.predict(face_roi)
-
-            if confidence < CONF_THRESHOLD:
-                name = self.id_to_name.get(id_num, "Unknown")
-                text = f"Logged In: {name}"
-                color = (0, 255, 0)  # Green
-                
-                # Update status
-                logged_in_name = name
+        if self._gray is None or self._gray.shape != frame.shape[:2]:
+            self._gray = np.empty(frame.shape[:2], dtype=np.uint8)
+            self._rgb = np.empty_like(frame)
+
+        # Face state changes slowly, so only detect on 1 of every N frames and
+        # redraw the previous results in between
+        detect = self._tick % DETECT_EVERY_N_TICKS == 0
+        self._tick += 1
+        if detect:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+            # Also skip detection if the frame barely changed since the last detection
+            thumb = motion_thumbnail(gray)
+            if not frame_changed(thumb, self._prev_thumb):
+                detect = False
+            else:
+                self._prev_thumb = thumb
+
+        if detect:
+            # Search only around the tracked faces, falling back to a full scan
+            # periodically or when the faces are lost
+            faces = []
+            if self._roi is not None and self._scans_since_full < FULL_SCAN_EVERY_N:
+                faces = detect_faces(self.face_detector, gray, self._roi)
+                self._scans_since_full += 1
+            if not faces:
+                faces = detect_faces(self.face_detector, gray)
+                self._scans_since_full = 0
+            self._roi = expand_roi(faces, gray.shape) if faces else None
+
+            predictions = [
+                self.recognizer.predict(cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE, interpolation=cv2.INTER_AREA))
+                for (x, y, w, h) in faces
+            ]
+            ids = np.array([id_num for id_num, _ in predictions], dtype=np.int32)
+            confidences = np.array([confidence for _, confidence in predictions], dtype=np.float64)
+            accepted, best_idx, best_id = classify(confidences, ids, float(CONF_THRESHOLD))
+
+            results = [
+                (f"Logged In: {self.id_to_name.get(int(id_num), 'Unknown')}", (0, 255, 0))  # Green
+                if ok else ("Login Failed", (0, 0, 255))  # Red
+                for id_num, ok in zip(ids, accepted)
+            ]
+
+            # Status shows the best recognized face, if any
+            if best_idx >= 0:
+                name = self.id_to_name.get(int(best_id), "Unknown")
                 status_text = f"Welcome, {name}!"
                 status_color = "green"
-
+            elif faces:
+                status_text = "Login Failed"
+                status_color = "red"
             else:
-                text = "Login Failed"
-                color = (0, 0, 255)  # Red
-                
-                # Update status only if not already logged in
-                if logged_in_name is None:
-                    status_text = "Login Failed"
-                    status_color = "red"
-
-            # Draw rectangle and text on the frame
+                status_text = "Scanning for face..."
+                status_color = "black"
+
+            self._last_faces = faces
+            self._last_result = results
+
+            self.set_status(status_text, status_color)
+
+        # Draw rectangle and text on the frame
+        for (x, y, w, h), (text, color) in zip(self._last_faces, self._last_result):
             cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
             cv2.putText(frame, text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
-        # Update GUI status label
-        self.status_var.set(status_text)
-        self.status_label.config(fg=status_color)
-
         # Convert OpenCV (BGR) frame to PIL (RGB) image
-        cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(cv2image)
-        
-        # Convert PIL image to Tkinter format
-        imgtk = ImageTk.PhotoImage(image=img)
-        
-        # Update the video label with the new image
-        self.video_label.imgtk = imgtk
-        self.video_label.configure(image=imgtk)
+        cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        height, width = cv2image.shape[:2]
+        if self._pil.size != (width, height):
+            # The camera did not honour the requested resolution
+            self.create_video_image(width, height)
+        self._pil.frombytes(cv2image.tobytes())
+
+        # Update the existing Tk image in place instead of creating a new one
+        self._tkimg.paste(self._pil)
 
         # Schedule the next frame update
-        self.root.after(10, self.update_frame)
+        self.root.after(0, self.update_frame)
 
     def on_closing(self):
         """Called when the 'Quit' button or window 'X' is pressed."""
         print("Closing application...")
-        if self.cap and self.cap.isOpened():
+        self._running = False
+        if self._grab_thread is not None:
+            self._grab_thread.join(timeout=1.0)
+        if self._grab_thread is not None and self._grab_thread.is_alive():
+            # Still blocked in grab(), releasing now would pull the capture out
+            # from under it. The daemon thread and capture go away on exit.
+            print("Warning: Camera thread did not stop, skipping camera release.")
+        elif self.cap and self.cap.isOpened():
             self.cap.release()
         self.root.destroy()
 
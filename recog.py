@@ -2,11 +2,34 @@ import cv2
 import os
 import numpy as np
 import json
+from concurrent.futures import ProcessPoolExecutor
+
+# orjson is optional, it only speeds up writing the name mapping
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- Constants ---
 DATASET_PATH = "dataset"
 MODEL_PATH = "model.yml"
 MAPPING_PATH = "name_mapping.json"
+FACE_SIZE = (100, 100)  # All training faces are normalized to this size
+CACHE_PATH = "face_cache"  # Decoded faces per user, reused while the user's images are unchanged
+
+def _decode(img_path, user_id):
+    """
+    Reads one dataset image in grayscale and normalizes it to a contiguous
+    FACE_SIZE uint8 array (runs in a worker process).
+    """
+    face_img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if face_img is None:
+        return None, user_id
+
+    # Images captured by dataset.py are already FACE_SIZE, older ones may not be
+    if face_img.shape[::-1] != FACE_SIZE:
+        face_img = cv2.resize(face_img, FACE_SIZE, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(face_img), user_id
 
 def train_model():
     """
@@ -25,44 +48,87 @@ def train_model():
     # This is the recognizer included in opencv-contrib
     recognizer = cv2.face.LBPHFaceRecognizer_create()
 
-    faces = []
-    ids = []
+    image_paths = []
+    user_ids = []
     name_to_id = {}
     current_id = 0
+    user_faces = {}  # user_id -> (N, 100, 100) uint8 array
+    stale_users = {}  # user_id -> cache file to (re)write after decoding
+    os.makedirs(CACHE_PATH, exist_ok=True)
     
-    # Walk through the dataset directory
-    for dir_name in os.listdir(DATASET_PATH):
-        user_path = os.path.join(DATASET_PATH, dir_name)
-        
-        if not os.path.isdir(user_path):
-            continue
-            
-        # Assign a numerical ID to this user
-        if dir_name not in name_to_id:
-            name_to_id[dir_name] = current_id
-            user_id = current_id
-            current_id += 1
-            print(f"Training on user: {dir_name} (ID: {user_id})")
-        else:
-            user_id = name_to_id[dir_name]
-
-        # Loop through all images for this user
-        for img_name in os.listdir(user_path):
-            if not img_name.endswith(('.jpg', '.png', '.jpeg')):
+    # Walk through the dataset directory. scandir entries cache the file
+    # type from the directory listing, so no extra stat call per entry.
+    with os.scandir(DATASET_PATH) as user_dirs:
+        for user_dir in user_dirs:
+            if not user_dir.is_dir():
                 continue
 
-            img_path = os.path.join(user_path, img_name)
-            
-            # Read the image in grayscale
-            face_img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-            
-            if face_img is None:
-                print(f"Warning: Could not read image {img_path}")
-                continue
+            dir_name = user_dir.name
+
+            # Assign a numerical ID to this user
+            if dir_name not in name_to_id:
+                name_to_id[dir_name] = current_id
+                user_id = current_id
+                current_id += 1
+                print(f"Training on user: {dir_name} (ID: {user_id})")
+            else:
+                user_id = name_to_id[dir_name]
+
+            # Loop through all images for this user, tracking the newest change.
+            # The directory mtime covers removed images, the file mtimes cover
+            # images overwritten in place when a user is captured again.
+            user_images = []
+            newest_mtime = user_dir.stat().st_mtime
+            with os.scandir(user_dir.path) as images:
+                for img in images:
+                    if not img.is_file() or not img.name.endswith(('.jpg', '.png', '.jpeg')):
+                        continue
+
+                    user_images.append(img.path)
+                    newest_mtime = max(newest_mtime, img.stat().st_mtime)
+
+            # Reuse the decoded faces if the cache is strictly newer than all
+            # of them, so an image written in the same mtime tick is not missed
+            cache_file = os.path.join(CACHE_PATH, f"{dir_name}.npy")
+            if os.path.exists(cache_file) and os.path.getmtime(cache_file) > newest_mtime:
+                try:
+                    user_faces[user_id] = np.load(cache_file)
+                    continue
+                except (OSError, ValueError, EOFError) as e:
+                    # A truncated or corrupt cache is treated as stale
+                    print(f"Warning: Could not read cache {cache_file}, rebuilding: {e}")
+            stale_users[user_id] = cache_file
 
-            # Append the face image and its corresponding ID
-            faces.append(face_img)
-            ids.append(user_id)
+            image_paths.extend(user_images)
+            user_ids.extend([user_id] * len(user_images))
+
+    # Decode the images of users without a valid cache in parallel, JPEG
+    # decoding is CPU-bound per file
+    decoded = {user_id: [] for user_id in stale_users}
+    if image_paths:
+        with ProcessPoolExecutor() as ex:
+            results = ex.map(_decode, image_paths, user_ids, chunksize=16)
+            for img_path, (face_img, user_id) in zip(image_paths, results):
+                if face_img is None:
+                    print(f"Warning: Could not read image {img_path}")
+                    continue
+                decoded[user_id].append(face_img)
+
+    for user_id, cache_file in stale_users.items():
+        user_faces[user_id] = np.array(decoded[user_id], dtype=np.uint8).reshape(-1, FACE_SIZE[1], FACE_SIZE[0])
+        # Write to a temp file and move it into place, so an interrupted run
+        # never leaves a truncated cache behind
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            np.save(f, user_faces[user_id])
+        os.replace(tmp_file, cache_file)
+
+    # Append the face images and their corresponding IDs
+    faces = []
+    ids = []
+    for user_id, stack in user_faces.items():
+        faces.extend(stack)
+        ids.extend([user_id] * len(stack))
 
     if not faces:
         print("No faces found to train. Exiting.")
@@ -73,14 +139,20 @@ def train_model():
 
     # Train the recognizer
     try:
-        recognizer.train(faces, np.array(ids))
+        recognizer.train(faces, np.array(ids, dtype=np.int32))
         
         # Save the trained model
         recognizer.write(MODEL_PATH)
         
         # Save the name-to-ID mapping
-        with open(MAPPING_PATH, 'w') as f:
-            json.dump(name_to_id, f, indent=4)
+        # Written as UTF-8 bytes, with the stdlib fallback matching orjson's
+        # output (non-ASCII names unescaped, 2-space indent)
+        if orjson:
+            data = orjson.dumps(name_to_id, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(name_to_id, indent=2, ensure_ascii=False).encode('utf-8')
+        with open(MAPPING_PATH, 'wb') as f:
+            f.write(data)
             
         print(f"\nTraining complete.")
         print(f"Model saved as: {MODEL_PATH}")